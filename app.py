@@ -1,42 +1,92 @@
 import streamlit as st
-import google.generativeai as genai
-from PyPDF2 import PdfReader
-import docx
-import os
-from dotenv import load_dotenv
 from datetime import datetime
-import io
-import re
-from reportlab.platypus import SimpleDocTemplate, Paragraph
-from reportlab.lib.pagesizes import A4
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.enums import TA_JUSTIFY
+import hashlib
+from core import (executor, extract_text, strip_header, compact_cv, trim_cv, pdf_style, export_pdf,
+                  load_api_key, get_client, warm_up, generation_config, open_stream, hedged_generate,
+                  cached_letter, prompt_key, remember_letter, submit_batch, get_batch,
+                  MAX_UPLOAD_BYTES)
 
-# Load environment variables
-load_dotenv()
+MODEL = "gemini-2.0-flash"
+
+# Fixed writing rules, sent once as the model's system instruction instead of
+# being repeated inside every prompt
+SYSTEM_PROMPT = """
+You are a professional cover letter writer. Create a clean, ready-to-use cover letter
+from the resume and job info you are given.
+
+📝 **Structure & Tone:**
+1. **Salutation:** Use specific name if given (e.g., \"Dear Mr./Ms. X\"), or \"Dear Hiring Manager\".
+2. **Intro:** Show enthusiasm and suitability for the role.
+3. **Body:**
+    - Match top 2–3 job requirements with real achievements/skills from CV.
+    - Use real examples and quantify (e.g., \"increased efficiency by 20%\").
+    - Highlight what value you bring to the company.
+4. **Motivation:** Optional — why you want to work at the company.
+5. **Closing:** Reaffirm interest and politely invite follow-up.
+6. **Signature:** Full name
+
+*Critical Instruction*
+    1. Do not include any placeholder text in square brackets like , [Date], [Company Name],, etc. 
+    2. Use the actual provided information: company name, position, etc.
+    3. Do not include any metadata, instructions, or notes in square brackets in the final output.
+    4. The output should be a clean, professional cover letter ready for immediate use.
+    5. Remove any text that appears in square brackets [ ] completely from the final output.
+    6. Always structure the paragrapgh and text allignment like professional cover letter
+    7. Do not include any address and instruction to fill the address
+
+Do not include any personal contact details or headers in final output.
+"""
+
+# Per-request prompt parts. The CV comes first since it stays the same across
+# jobs; the job inputs follow and the date goes last
+CV_TEMPLATE = """
+Resume (achievements, skills, experiences):
+{cv_text}
+"""
+
+PROMPT_TEMPLATE = """
+Job Info:
+- Position: {job_title}
+- Company: {company}
+- Description: {job_desc}
+- Requirements: {job_reqs}
+
+Instructions:
+- Language: {lang}
+- Length: approx. {word_len} words
+- Address to: {hr_line}
+
+Date: {today}
+"""
 
 # Configure page
 st.set_page_config(page_title="Cover Letter Generator", page_icon="📝", layout="wide")
 
 # Gemini API setup
-api_key = os.getenv("GEMINI_API_KEY")
-if not api_key:
-    st.error("❌ GEMINI_API_KEY not found in environment variables!")
-    st.stop()
-
 try:
-    genai.configure(api_key=api_key)
+    api_key = load_api_key()
 except Exception as e:
     st.error(f"❌ Error configuring Gemini API: {e}")
     st.stop()
 
+if not api_key:
+    # Don't keep the miss cached, so a fixed .env is picked up on the next run
+    load_api_key.clear()
+    st.error("❌ GEMINI_API_KEY not found in environment variables!")
+    st.stop()
+
+# Connect to Gemini while the user uploads a CV and fills in the form
+warm_up(MODEL, api_key)
+
 st.title("📝 Cover Letter Generator")
 st.markdown("Generate professional cover letters using **Gemini 2.0 Flash**")
 
 # File upload and inputs
 cv_file = st.file_uploader("📎 Upload your CV (PDF, DOCX, TXT)", type=["pdf", "docx", "txt"])
 
-with st.form("form"):
+tab_single, tab_batch = st.tabs(["✉️ Single letter", "📚 Batch mode"])
+
+with tab_single, st.form("form"):
     job_title = st.text_input("Job Title")
     company   = st.text_input("Company Name")
     job_desc  = st.text_area("Job Description")
@@ -47,138 +97,175 @@ with st.form("form"):
     language  = st.radio("Language", ["English", "Bahasa Indonesia"])
     submitted = st.form_submit_button("Generate Cover Letter")
 
-# Helper: extract text
-def extract_text_from_pdf(f):
-    reader = PdfReader(f)
-    return "\n".join(page.extract_text() or "" for page in reader.pages)
-
-def extract_text_from_docx(f):
-    doc = docx.Document(f)
-    return "\n".join(p.text for p in doc.paragraphs)
-
-def extract_text(f):
-    t = ""
-    if f.type == "application/pdf":
-        t = extract_text_from_pdf(f)
-    elif f.type.startswith("application/vnd.openxmlformats"):
-        t = extract_text_from_docx(f)
-    elif f.type == "text/plain":
-        t = f.read().decode("utf-8")
-    return t
-
-# Strip header info
-def strip_header(text):
-    lines = text.splitlines()
-    cleaned = []
-    header_ended = False
-    for line in lines:
-        if not header_ended:
-            if re.search(r"[\w\.-]+@[\w\.-]+", line) \
-               or re.search(r"(?<!\d)(\+62|08|62)[\d\s\-]{6,}(?!\d)", line) \
-               or re.search(r"\b\d{1,2}\s+(January|February|March|April|May|June|July|August|September|October|November|December)\b", line, re.IGNORECASE) \
-               or len(line.strip()) == 0:
-                continue
-            else:
-                header_ended = True
-        cleaned.append(line)
-    return "\n".join(cleaned).strip()
-
-# Generate prompt
-def generate_prompt(cv_text):
+compact = st.sidebar.checkbox("Compact CV in prompt", value=True,
+                              help="Drop blank lines and long bullet runs, and shorten long CVs section by section, to cut prompt size")
+fast_mode = st.sidebar.toggle("Fast mode", value=False,
+                             help="Send two identical requests and keep whichever answers first (about 2× API cost)")
+regenerate = st.sidebar.checkbox("Regenerate (bypass cache)", value=False,
+                                 help="Ask Gemini for a new letter even if these inputs were answered before")
+max_pages = st.sidebar.number_input("Max CV pages", min_value=1, max_value=50, value=6,
+                                    help="Only read this many pages of a PDF CV")
+
+# Oversized files are refused before they reach a parser
+if cv_file is not None and cv_file.size > MAX_UPLOAD_BYTES:
+    st.error(f"❌ CV file exceeds {MAX_UPLOAD_BYTES // (1024 * 1024)} MB.")
+    cv_file = None
+
+# Start parsing as soon as a new CV is uploaded (or the page limit changes),
+# while the form is filled in
+if cv_file is not None and st.session_state.get("cv_file_id") != (cv_file.file_id, max_pages):
+    st.session_state.cv_file_id = (cv_file.file_id, max_pages)
+    st.session_state.cv_future = executor().submit(extract_text, cv_file.getvalue(), cv_file.type, max_pages)
+
+# Generate prompt as [CV part, job part]
+def generate_prompt(cv_text, job_title, company, job_desc, job_reqs):
+    if compact:
+        cv_text = trim_cv(compact_cv(cv_text))
     today   = datetime.now().strftime("%d %B %Y")
     hr_line = f"to {hr_name}, {hr_role}" if hr_name and hr_role else hr_name or "the Hiring Team"
     lang    = "Indonesian (Bahasa Indonesia)" if language == "Bahasa Indonesia" else "English"
 
-    return f"""
-You are a professional cover letter writer. Create a clean, ready-to-use cover letter:
-
-Date: {today}
-
-Resume (achievements, skills, experiences):
-{cv_text}
-
-Job Info:
-- Position: {job_title}
-- Company: {company}
-- Description: {job_desc}
-- Requirements: {job_reqs}
-
-Instructions:
-- Language: {lang}
-- Length: approx. {word_len} words
-- Address to: {hr_line}
-
-Structure:
-📝 **Structure & Tone:**
-1. **Salutation:** Use specific name if given (e.g., \"Dear Mr./Ms. X\"), or \"Dear Hiring Manager\".
-2. **Intro:** Show enthusiasm and suitability for the role.
-3. **Body:**
-    - Match top 2–3 job requirements with real achievements/skills from CV.
-    - Use real examples and quantify (e.g., \"increased efficiency by 20%\").
-    - Highlight what value you bring to {company}.
-4. **Motivation:** Optional — why you want to work at {company}.
-5. **Closing:** Reaffirm interest and politely invite follow-up.
-6. **Signature:** Full name
-
-*Critical Instruction*
-    1. Do not include any placeholder text in square brackets like , [Date], [Company Name],, etc. 
-    2. Use the actual provided information: {company}, etc.
-    3. Do not include any metadata, instructions, or notes in square brackets in the final output.
-    4. The output should be a clean, professional cover letter ready for immediate use.
-    5. Remove any text that appears in square brackets [ ] completely from the final output.
-    6. Always structure the paragrapgh and text allignment like professional cover letter
-    7. Do not include any address and instruction to fill the address
-
-Do not include any personal contact details or headers in final output.
-"""
-
-# Export PDF with first-line indent
-def export_pdf(letter_text):
-    buffer = io.BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=A4,
-                            leftMargin=40, rightMargin=40,
-                            topMargin=40, bottomMargin=40)
-    styles = getSampleStyleSheet()
-    style = ParagraphStyle(
-        'Justify',
-        parent=styles['Normal'],
-        alignment=TA_JUSTIFY,
-        fontName='Times-Roman',
-        fontSize=12,
-        leading=16,
-        firstLineIndent=20  # indent first line
-    )
-    elements = []
-    for para in letter_text.split("\n\n"):
-        elements.append(Paragraph(para.strip().replace("\n", " "), style))
-    doc.build(elements)
-    buffer.seek(0)
-    return buffer
+    return [
+        CV_TEMPLATE.format(cv_text=cv_text),
+        PROMPT_TEMPLATE.format_map({
+            "today": today, "job_title": job_title, "company": company,
+            "job_desc": job_desc, "job_reqs": job_reqs, "lang": lang, "word_len": word_len,
+            "hr_line": hr_line,
+        }),
+    ]
+
+# Batch mode: several jobs for the same CV in one Gemini batch job
+with tab_batch:
+    st.caption("Queue several jobs for the uploaded CV. They run as one Gemini batch job "
+               "(about half the cost, results can take a while). Length, HR and language "
+               "settings are taken from the single-letter form.")
+    jobs = st.data_editor(
+        [{"Job Title": "", "Company": "", "Description": "", "Requirements": ""}],
+        num_rows="dynamic", use_container_width=True, key="batch_jobs")
+
+    if st.button("🚀 Submit batch", disabled=cv_file is None):
+        rows = [j for j in jobs if j["Job Title"] and j["Company"] and j["Description"]]
+        cv_text = None
+        if not rows:
+            st.warning("⚠️ Add at least one job with title, company and description.")
+        else:
+            try:
+                cv_text = strip_header(st.session_state.cv_future.result())
+            except Exception as e:
+                # Unknown file types and corrupt files fail in the background read
+                st.error(f"❌ Error reading CV: {e}")
+        if cv_text:
+            prompts = [generate_prompt(cv_text, j["Job Title"], j["Company"],
+                                       j["Description"], j["Requirements"] or "") for j in rows]
+            keys = [f"{j['Company']} — {j['Job Title']}" for j in rows]
+            try:
+                # Keep the job id in the URL so the results can be picked up later
+                st.query_params["batch"] = submit_batch(get_client(api_key), prompts, keys,
+                                                        SYSTEM_PROMPT, generation_config(word_len), MODEL)
+            except Exception as e:
+                st.error(f"❌ Couldn't submit the batch: {e}")
+
+    batch_id = st.query_params.get("batch")
+    job = None
+    if batch_id:
+        try:
+            job = get_batch(get_client(api_key), batch_id)
+        except Exception as e:
+            # A stale id stays in the URL, so offer a way out instead of failing every run
+            st.error(f"❌ Couldn't load batch `{batch_id}`: {e}")
+            if st.button("🗑️ Forget this batch"):
+                del st.query_params["batch"]
+                st.rerun()
+    if job:
+        state = job.state or "JOB_STATE_PENDING"
+        st.write(f"Batch `{batch_id}`: **{state.removeprefix('JOB_STATE_').title()}**")
+        if state == "JOB_STATE_SUCCEEDED":
+            for i, item in enumerate(job.dest.inlined_responses):
+                with st.expander((item.metadata or {}).get("key", f"Cover letter {i + 1}")):
+                    if item.error:
+                        st.error(f"❌ {item.error.message or item.error}")
+                        continue
+                    st.text_area("Letter", (item.response and item.response.text or "").strip(),
+                                 height=300, key=f"batch_letter_{i}")
+        elif state in ("JOB_STATE_QUEUED", "JOB_STATE_PENDING", "JOB_STATE_RUNNING"):
+            st.button("🔄 Refresh status")
 
 # Main logic
-if submitted and cv_file:
-    if not (job_title and company and job_desc and job_reqs):
-        st.warning("⚠️ Please fill all job fields.")
-        st.stop()
-
-    with st.spinner("Reading CV…"):
-        raw_text = extract_text(cv_file)
-        clean_text = strip_header(raw_text)
-
-    with st.spinner("Generating letter…"):
-        prompt = generate_prompt(clean_text)
-        model = genai.GenerativeModel("gemini-2.0-flash")
-        resp = model.generate_content(prompt)
-        letter = resp.text.strip()
-
-    st.subheader("📄 Generated Cover Letter")
-    st.text_area("Preview", letter, height=350)
-
-    pdf = export_pdf(letter)
-    st.download_button("📥 Download PDF", data=pdf,
-                       file_name="Cover_Letter.pdf", mime="application/pdf")
-else:
-    st.info("👆 Upload CV and fill the form to generate a cover letter.")
+with tab_single:
+    if submitted and cv_file:
+        if not (job_title and company and job_desc and job_reqs):
+            st.warning("⚠️ Please fill all job fields.")
+            st.stop()
+
+        with st.spinner("Reading CV…"):
+            try:
+                raw_text = st.session_state.cv_future.result()
+            except Exception as e:
+                # Unknown file types and corrupt files fail in the background read
+                st.error(f"❌ Error reading CV: {e}")
+                st.stop()
+            clean_text = strip_header(raw_text)
+
+        preview = st.empty()
+
+        # Load ReportLab and build the letter style while Gemini is writing,
+        # so the background PDF build only has the layout left to do
+        executor().submit(pdf_style)
+
+        prompt = generate_prompt(clean_text, job_title, company, job_desc, job_reqs)
+        config = {**generation_config(word_len), "system_instruction": SYSTEM_PROMPT}
+        # The key covers the system prompt and token cap too, so cached letters
+        # built under older settings aren't served after they change
+        key = prompt_key(MODEL, SYSTEM_PROMPT, repr(generation_config(word_len)), *prompt)
+        # Identical inputs come from the cache unless a fresh letter was asked for
+        letter = None if regenerate else cached_letter(key)
+        if letter is None:
+            client = get_client(api_key)
+            finish = []
+            if fast_mode:
+                with st.spinner("Generating letter…"):
+                    letter = hedged_generate(client, MODEL, prompt, config, finish=finish).strip()
+            else:
+                # Spinner only until the first chunk; after that the text itself shows progress
+                with st.spinner("Generating letter…"):
+                    chunks = open_stream(client, MODEL, prompt, config, finish=finish)
+                letter = preview.write_stream(chunks).strip()
+            # A letter cut off at the token limit is shown but not cached
+            if "MAX_TOKENS" in finish:
+                st.warning("⚠️ The letter hit the length limit and may be cut off. "
+                           "Generate again or pick a shorter length.")
+            elif letter:
+                remember_letter(key, letter)
+
+        preview.empty()
+        # Blocked or empty responses are reported; there is nothing to keep or export
+        if not letter:
+            st.error("❌ The model returned no text (the response may have been blocked). Try adjusting the job details.")
+            st.stop()
+
+        # Keep the result so download clicks and other reruns don't regenerate
+        st.session_state.letter = letter
+        # Same letter as before (cache hit or repeat click): keep the PDF we have
+        pdf_hash = hashlib.blake2b(letter.encode(), digest_size=8).digest()
+        if st.session_state.get("pdf_hash") != pdf_hash:
+            st.session_state.pdf_hash = pdf_hash
+            st.session_state.pop("pdf", None)
+            # Build the PDF off the main thread while the user reads the preview
+            st.session_state.pdf_future = executor().submit(export_pdf, letter)
+
+    if "letter" in st.session_state:
+        st.subheader("📄 Generated Cover Letter")
+        st.text_area("Preview", st.session_state.letter, height=350)
+
+        # The PDF is built in the background; only collect it when asked for
+        if "pdf" not in st.session_state and st.button("🧾 Prepare PDF"):
+            with st.spinner("Building PDF…"):
+                st.session_state.pdf = st.session_state.pdf_future.result()
+        if "pdf" in st.session_state:
+            st.download_button("📥 Download PDF", data=st.session_state.pdf,
+                               file_name="Cover_Letter.pdf", mime="application/pdf")
+    else:
+        st.info("👆 Upload CV and fill the form to generate a cover letter.")
 
 
 
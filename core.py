@@ -0,0 +1,491 @@
+# Shared, UI-free pieces of the cover letter apps: CV text extraction and
+# cleanup, PDF export and Gemini access. app.py and main.py import from here,
+# and since Streamlit only re-executes the page script on a rerun, everything
+# in this module (and the caches attached to it) is loaded once per process.
+import streamlit as st
+from dotenv import load_dotenv
+from google import genai
+import pypdfium2 as pdfium
+import os
+import io
+import re
+import hashlib
+import time
+import shutil
+import subprocess
+import tempfile
+import zipfile
+import xml.etree.ElementTree as ET
+from itertools import islice, chain
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+# Header lines (email, phone or "12 March" date), matched in a single pass
+HEADER_RE = re.compile(
+    r"[\w\.-]+@[\w\.-]+"
+    r"|(?<!\d)(?:\+62|08|62)[\d\s\-]{6,}(?!\d)"
+    r"|\b\d{1,2}\s+(?:January|February|March|April|May|June|July|August|September|October|November|December)\b",
+    re.IGNORECASE)
+WS_RE    = re.compile(r"\s+")
+BULLET_RE = re.compile(r"^[•▪●◦*\-–]\s*")
+PARA_SPLIT = re.compile(r"\n\s*\n")
+# Trailing spaces/tabs, and runs of two or more blank lines
+BLANK_RE = re.compile(r"[ \t]+(?=\n)|\n(?:[ \t]*\n){2,}")
+# Short heading lines that open a CV section: all caps ("SKILLS & TOOLS") or
+# title case ("Work Experience", "Education:")
+SECTION_RE = re.compile(
+    r"^(?:[A-Z][A-Z &/]{2,}|[A-Z][a-z]+(?: (?:&|and|of|[A-Z][a-z]+)){0,3}):?[ \t]*$",
+    re.MULTILINE)
+# CV lines that never help a cover letter: references/hobbies/interests lines
+# and "Page 1 of 2" footers
+BOILERPLATE_RE = re.compile(
+    r"^(?:references?|hobbies|interests)\b|^page\s+\d+(?:\s+of\s+\d+)?$",
+    re.IGNORECASE)
+
+# WordprocessingML namespace used in word/document.xml
+W_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+
+# PDF page margins (points), shared by every export on an A4 page
+PDF_MARGINS = dict(leftMargin=40, rightMargin=40, topMargin=40, bottomMargin=40)
+
+# Context caching needs a pinned model version and a minimum prompt size
+CACHE_MODEL = 'gemini-2.0-flash-001'
+CACHE_MIN_TOKENS = 4096
+EMBED_MODEL = 'text-embedding-004'
+
+# Shared worker pool for background CV parsing, PDF builds and warm-up calls
+@st.cache_resource
+def executor():
+    return ThreadPoolExecutor(max_workers=4)
+
+# Separate pool for hedged requests: the losing request can't be cancelled
+# once it runs, so it must not hold a worker that CV parsing is waiting for
+@st.cache_resource
+def hedge_executor():
+    return ThreadPoolExecutor(max_workers=8)
+
+# ---------------------------------------------------------------------------
+# CV text extraction
+# ---------------------------------------------------------------------------
+
+# Uploads above this size are rejected before any parsing
+MAX_UPLOAD_BYTES = 10 * 1024 * 1024
+
+# Poppler's pdftotext, if installed; tried before PyPDF2 for PDFs PDFium refuses
+PDFTOTEXT = shutil.which("pdftotext")
+
+def _pdftotext(data, max_pages=None):
+    with tempfile.NamedTemporaryFile(suffix=".pdf") as tmp:
+        tmp.write(data)
+        tmp.flush()
+        limit = ["-l", str(max_pages)] if max_pages else []
+        out = subprocess.run([PDFTOTEXT, "-layout", *limit, tmp.name, "-"],
+                             capture_output=True, check=True, timeout=30)
+    return out.stdout.decode("utf-8", errors="replace")
+
+# Only the first max_pages pages are read, so a huge or pathological PDF
+# can't hold up the session
+def extract_text_from_pdf(f, max_pages=None):
+    # PDFium (native) text extraction; image-only pages ("") are dropped
+    try:
+        pdf = pdfium.PdfDocument(f)
+        texts = []
+        try:
+            for page in islice(pdf, max_pages):
+                textpage = page.get_textpage()
+                t = textpage.get_text_range()
+                textpage.close()
+                page.close()
+                if t:
+                    texts.append(t)
+        finally:
+            # Release the native document even if a page fails to parse
+            pdf.close()
+        return "\n".join(texts).replace("\r\n", "\n")
+    except pdfium.PdfiumError:
+        if PDFTOTEXT:
+            try:
+                return _pdftotext(f.getvalue(), max_pages)
+            except (subprocess.SubprocessError, OSError):
+                pass
+        # PyPDF2 fallback for files PDFium refuses
+        # Imported here so most uploads never load PyPDF2
+        from PyPDF2 import PdfReader
+        f.seek(0)
+        reader = PdfReader(f)
+        pages = islice(reader.pages, max_pages)
+        return "\n".join(t for t in (p.extract_text() for p in pages) if t)
+
+def extract_text_from_docx(f):
+    # Stream <w:p>/<w:t> straight from the XML instead of building a python-docx DOM
+    out = []
+    with zipfile.ZipFile(f) as z, z.open("word/document.xml") as xml:
+        for _, el in ET.iterparse(xml, events=("end",)):
+            if el.tag == W_NS + "p":
+                out.append("".join(t.text or "" for t in el.iter(W_NS + "t")))
+                el.clear()
+    return "\n".join(out)
+
+# Cached on the upload's bytes, type and page limit, so reruns with the same CV skip
+# parsing. Unsupported types raise ValueError
+@st.cache_data(max_entries=32, ttl=3600, show_spinner=False)
+def extract_text(file_bytes, mime, max_pages=None):
+    if not file_bytes:
+        # Empty upload: nothing to parse (and the PDF parsers would raise)
+        return ""
+    if mime == "application/pdf":
+        text = extract_text_from_pdf(io.BytesIO(file_bytes), max_pages)
+    elif mime.startswith("application/vnd.openxmlformats"):
+        text = extract_text_from_docx(io.BytesIO(file_bytes))
+    elif mime == "text/plain":
+        # A stray non-UTF-8 byte shouldn't lose the whole CV
+        text = file_bytes.decode("utf-8", errors="replace")
+    else:
+        raise ValueError("Unsupported file type. Please upload PDF, DOCX, or TXT files.")
+    # Extractors (PyPDF2 especially) leave padding and blank-line runs that
+    # would only add prompt tokens
+    return BLANK_RE.sub(lambda m: "\n\n" if m.group()[0] == "\n" else "", text).strip()
+
+# ---------------------------------------------------------------------------
+# CV text cleanup
+# ---------------------------------------------------------------------------
+
+# Strip header info
+def strip_header(text):
+    # Walk only the header lines; the body is returned as one slice
+    start = 0
+    while start < len(text):
+        end = text.find("\n", start)
+        if end == -1:
+            end = len(text)
+        line = text[start:end]
+        if not (len(line.strip()) == 0 or HEADER_RE.search(line)):
+            break
+        start = end + 1
+    return text[start:].strip()
+
+# Shrink CV text before it goes into the prompt: drop blank and boilerplate
+# lines and long bullet runs (trim_cv does the length cap)
+def compact_cv(text, max_bullets=4):
+    lines = []
+    bullets = 0
+    for line in text.splitlines():
+        line = WS_RE.sub(" ", line).strip()
+        if not line or BOILERPLATE_RE.match(line):
+            continue
+        # Keep only the first few bullets of each run (i.e. per role)
+        if BULLET_RE.match(line):
+            bullets += 1
+            if bullets > max_bullets:
+                continue
+        else:
+            bullets = 0
+        lines.append(line)
+    return "\n".join(lines)
+
+# First max_chars of text, cut on a line boundary where that keeps at least
+# half of it, otherwise on a word boundary
+def _head(text, max_chars):
+    if len(text) <= max_chars:
+        return text
+    cut = text.rfind("\n", 0, max_chars)
+    if cut < max_chars // 2:
+        cut = text.rfind(" ", 0, max_chars)
+    return text[:cut if cut > 0 else max_chars].rstrip()
+
+# Cut a long CV down to max_chars, keeping the start of every section instead
+# of dropping whole sections off the end. Sections shorter than an even share
+# are kept whole and the budget they don't use goes to the longer ones.
+# Without at least two headings, or with too many to give each a character,
+# it falls back to a plain head cut
+def trim_cv(text, max_chars=6000):
+    if len(text) <= max_chars:
+        return text
+    starts = [0] + [m.start() for m in SECTION_RE.finditer(text) if m.start()]
+    if len(starts) < 3:
+        return _head(text, max_chars)
+    sections = [t for t in (text[a:b].strip() for a, b in zip(starts, starts[1:] + [len(text)])) if t]
+
+    # Two characters per section go to the blank line joining them
+    budget = max_chars - 2 * len(sections)
+    if budget < len(sections):
+        return _head(text, max_chars)
+    limits = {}
+    pending = sorted(range(len(sections)), key=lambda i: len(sections[i]))
+    while pending and len(sections[pending[0]]) <= budget // len(pending):
+        i = pending.pop(0)
+        limits[i] = len(sections[i])
+        budget -= limits[i]
+    for i in pending:
+        limits[i] = budget // len(pending)
+    return "\n\n".join(_head(t, limits[i]) for i, t in enumerate(sections))
+
+# ---------------------------------------------------------------------------
+# PDF export
+# ---------------------------------------------------------------------------
+
+# Letter style, built once per server process instead of on every export.
+# ReportLab is only imported once a PDF is actually needed
+@st.cache_resource
+def pdf_style():
+    from reportlab import rl_config
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.lib.enums import TA_JUSTIFY
+
+    # Skip ReportLab's per-attribute shape validation unless debugging
+    if not os.getenv("DEBUG"):
+        rl_config.shapeChecking = 0
+
+    styles = getSampleStyleSheet()
+    return ParagraphStyle(
+        'Justify',
+        parent=styles['Normal'],
+        alignment=TA_JUSTIFY,
+        fontName='Times-Roman',
+        fontSize=12,
+        leading=16,
+        firstLineIndent=20  # indent first line
+    )
+
+# Export PDF with first-line indent; cached as bytes so the same letter is
+# only ever laid out once
+@st.cache_data(show_spinner=False, max_entries=16)
+def export_pdf(letter_text):
+    style = pdf_style()
+    from reportlab.platypus import SimpleDocTemplate, Paragraph
+    from reportlab.lib.pagesizes import A4
+
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4, **PDF_MARGINS)
+    # One flowable per paragraph; whitespace-only separator lines count as breaks
+    elements = [Paragraph(p.strip().replace("\n", " "), style)
+                for p in PARA_SPLIT.split(letter_text) if p.strip()]
+    doc.build(elements)
+    return buffer.getvalue()
+
+# ---------------------------------------------------------------------------
+# Gemini access
+# ---------------------------------------------------------------------------
+
+# Gemini client, one per API key per process. It owns the HTTP connection
+# pool, so keeping it across reruns keeps the connection to the API open
+# Load .env once per server process and return the Gemini key from it. On a
+# miss, call load_api_key.clear() so a fixed .env is picked up on the next run
+@st.cache_resource(show_spinner=False)
+def load_api_key():
+    load_dotenv()
+    return os.getenv("GEMINI_API_KEY")
+
+@st.cache_resource(show_spinner=False)
+def get_client(api_key):
+    return genai.Client(api_key=api_key)
+
+# Open the client's connection in the background with a free count_tokens call,
+# so the first generation doesn't pay for the TLS setup. Runs once per model
+# and key; a failure here is left for the real request to report
+@st.cache_resource(show_spinner=False)
+def warm_up(model_name, api_key):
+    return executor().submit(get_client(api_key).models.count_tokens, model=model_name,
+                             contents="ok", config={"http_options": {"timeout": 10000}})
+
+# Bound the output to the requested length: 3 tokens per word covers the
+# length tolerance and Indonesian, which runs close to 3 tokens a word. The
+# 400-token floor keeps short targets from cutting off the greeting or sign-off
+def generation_config(word_len):
+    return {"max_output_tokens": max(400, word_len * 3), "temperature": 0.7, "candidate_count": 1}
+
+# Finish reason of a response or stream chunk, None while still generating
+def finish_reason(response):
+    return response.candidates[0].finish_reason if response.candidates else None
+
+# Start a streamed generation and return its text chunks. The SDK's stream is
+# lazy, so the first chunk is fetched here: errors and the wait before any
+# text happen in this call rather than mid-render. Safety-filtered or empty
+# chunks have no text. Finish reasons are appended to `finish` if given
+def open_stream(client, model_name, contents, config=None, finish=None):
+    response = client.models.generate_content_stream(model=model_name, contents=contents, config=config)
+    first = next(response, None)
+    chunks = response if first is None else chain([first], response)
+
+    def texts():
+        for chunk in chunks:
+            reason = finish_reason(chunk)
+            if reason and finish is not None:
+                finish.append(reason)
+            if chunk.text:
+                yield chunk.text
+    return texts()
+
+# Hedged request: same prompt sent n times, first good answer wins
+def hedged_generate(client, model_name, prompt, config=None, n=2, finish=None):
+    pending = {hedge_executor().submit(client.models.generate_content, model=model_name,
+                                       contents=prompt, config=config)
+               for _ in range(n)}
+    error = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for f in done:
+            if f.exception() is None:
+                for p in pending:
+                    p.cancel()
+                response = f.result()
+                if finish is not None and finish_reason(response):
+                    finish.append(finish_reason(response))
+                return response.text or ""
+            error = f.exception()
+    raise error
+
+# In-memory layer of the letter cache: finished letters shared across
+# sessions, keyed on a prompt_key hash of everything that shapes the letter,
+# and emptied daily (the disk layer below keeps them for LETTER_TTL). A plain
+# dict rather than st.cache_data, since streamed output can't be replayed
+# from a cached call
+@st.cache_resource(ttl=86400)
+def letter_cache():
+    return {}
+
+def prompt_key(*parts):
+    h = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        h.update(part.encode())
+        h.update(b"\0")
+    return h.hexdigest()
+
+# Letters are also written to disk, one file per key, so they survive a
+# restart; files older than LETTER_TTL are deleted, since they hold CV details
+LETTER_DIR = os.path.join(".cache", "letters")
+LETTER_TTL = 30 * 86400
+
+def _sweep_letters():
+    cutoff = time.time() - LETTER_TTL
+    with os.scandir(LETTER_DIR) as entries:
+        for entry in entries:
+            if entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+
+def _remember_in_memory(key, letter, max_entries):
+    cache = letter_cache()
+    if len(cache) >= max_entries:
+        # Dicts keep insertion order, so this drops the oldest letter
+        cache.pop(next(iter(cache)))
+    cache[key] = letter
+
+def cached_letter(key, max_entries=128):
+    letter = letter_cache().get(key)
+    if letter:
+        return letter
+    path = os.path.join(LETTER_DIR, key + ".txt")
+    try:
+        if time.time() - os.path.getmtime(path) > LETTER_TTL:
+            os.remove(path)
+            return None
+        with open(path, encoding="utf-8") as f:
+            letter = f.read()
+    except OSError:
+        return None
+    if not letter:
+        # An empty letter is never a valid answer
+        return None
+    _remember_in_memory(key, letter, max_entries)
+    return letter
+
+def remember_letter(key, letter, max_entries=128):
+    _remember_in_memory(key, letter, max_entries)
+    path = os.path.join(LETTER_DIR, key + ".txt")
+    try:
+        os.makedirs(LETTER_DIR, exist_ok=True)
+        # Write then rename, so a concurrent reader never sees half a letter
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            f.write(letter)
+        os.replace(path + ".tmp", path)
+        # Letters are written rarely, so this is a cheap place to drop expired ones
+        _sweep_letters()
+    except OSError:
+        # Read-only or full disk: the in-memory copy still serves this process
+        pass
+
+# Whether a prompt prefix is big enough for a context cache (rough estimate
+# of ~4 characters per token; most CVs fall below the minimum)
+def cacheable(prefix):
+    return len(prefix) // 4 >= CACHE_MIN_TOKENS
+
+# Upload a prompt prefix to a Gemini context cache for ttl seconds; None if it
+# is below the minimum size or the cache can't be created
+def create_context_cache(client, prefix, ttl=3600):
+    if not cacheable(prefix):
+        return None
+    try:
+        return client.caches.create(model=CACHE_MODEL,
+                                    config={"contents": [prefix], "ttl": f"{ttl}s"}).name
+    except Exception:
+        return None
+
+# Split CV text into ~100-token chunks (~400 chars) with ~20 tokens of overlap,
+# preferring to cut at line breaks
+def _chunk_text(text, size=400, overlap=80):
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = min(start + size, len(text))
+        if end < len(text):
+            cut = text.rfind("\n", start + overlap, end)
+            if cut == -1:
+                cut = text.rfind(" ", start + overlap, end)
+            if cut != -1:
+                end = cut
+        chunk = text[start:end].strip()
+        if chunk:
+            chunks.append(chunk)
+        if end >= len(text):
+            break
+        start = max(end - overlap, start + 1)
+    return chunks
+
+# Embed the CV chunks once per CV (the API takes at most 100 texts per call)
+@st.cache_data(ttl=3600, show_spinner=False)
+def _embed_cv(_client, chunks):
+    vectors = []
+    for i in range(0, len(chunks), 100):
+        result = _client.models.embed_content(
+            model=EMBED_MODEL,
+            contents=chunks[i:i + 100],
+            config={"task_type": "RETRIEVAL_DOCUMENT"}
+        )
+        vectors.extend(e.values for e in result.embeddings)
+    return vectors
+
+# Keep the first CV chunk plus the top_k chunks closest to the job text, in CV order
+def select_cv_sections(client, cv_text, job_text, top_k=10):
+    chunks = _chunk_text(cv_text)
+    # Short CVs are kept whole, without an embedding call
+    if len(chunks) <= top_k + 1:
+        return cv_text
+    vectors = _embed_cv(client, chunks)
+
+    query = client.models.embed_content(model=EMBED_MODEL, contents=job_text,
+                                        config={"task_type": "RETRIEVAL_QUERY"}).embeddings[0].values
+    scores = [sum(a * b for a, b in zip(vec, query)) for vec in vectors[1:]]
+    ranked = sorted(range(len(scores)), key=scores.__getitem__, reverse=True)[:top_k]
+    # Chunk 0 usually holds the name and contact header
+    keep = [0] + sorted(i + 1 for i in ranked)
+    return "\n...\n".join(chunks[i] for i in keep)
+
+# Submit one Gemini batch job with an inline request per prompt; returns the job name
+def submit_batch(client, prompts, keys, system_instruction, config, model="gemini-2.0-flash"):
+    src = [{"contents": p, "metadata": {"key": k},
+            "config": {**config, "system_instruction": system_instruction}}
+           for p, k in zip(prompts, keys)]
+    return client.batches.create(model=model, src=src, config={"display_name": "cover-letters"}).name
+
+def get_batch(client, name):
+    return client.batches.get(name=name)
+
+# Check an API key's format. No request is made here: a key that is
+# well-formed but rejected surfaces as API_KEY_INVALID / PERMISSION_DENIED on
+# the first real generation
+def validate_api_key(api_key):
+    if not api_key or not api_key.startswith('AIza'):
+        return False, "API key should start with 'AIza'"
+    # Gemini API keys are 39 characters long
+    if len(api_key) != 39:
+        return False, "API key looks incomplete. Make sure you copied the whole key."
+    return True, "API key format is valid"
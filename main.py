@@ -1,13 +1,11 @@
 import streamlit as st
-import google.generativeai as genai
-from PyPDF2 import PdfReader
-import docx
 import os
-from dotenv import load_dotenv
+import re
+import hashlib
 from datetime import datetime
-
-# Load environment variables
-load_dotenv()
+from core import (extract_text, load_api_key, get_client, warm_up, open_stream, finish_reason,
+                  cached_letter, prompt_key, remember_letter, create_context_cache, select_cv_sections,
+                  validate_api_key, trim_cv, cacheable, CACHE_MODEL, MAX_UPLOAD_BYTES)
 
 # Configure page
 st.set_page_config(
@@ -16,33 +14,24 @@ st.set_page_config(
     layout="wide"
 )
 
-# Function to validate API key
-def validate_api_key(api_key):
-    """Validate if the API key is working by making a simple test call"""
-    try:
-        if not api_key or not api_key.startswith('AIza'):
-            return False, "API key should start with 'AIza'"
-        
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel('gemini-2.0-flash-exp')
-        
-        # Make a simple test call
-        response = model.generate_content("Hello")
-        return True, "API key is valid"
-    except Exception as e:
-        error_msg = str(e)
-        if "API_KEY_INVALID" in error_msg:
-            return False, "Invalid API key. Please check your key."
-        elif "PERMISSION_DENIED" in error_msg:
-            return False, "API key doesn't have permission for Gemini API."
-        elif "QUOTA_EXCEEDED" in error_msg:
-            return False, "API quota exceeded. Please check your usage."
-        else:
-            return False, f"Error: {error_msg}"
+# Characters that aren't safe in a download filename
+SLUG_RE = re.compile(r'[^A-Za-z0-9_]+')
+
+# Sidebar steps for getting a key, shown whenever the key is missing or invalid
+_API_KEY_HELP = """
+### 🔗 How to get Gemini API Key:
+1. Visit [Google AI Studio](https://aistudio.google.com/app/apikey)
+2. Create a new API key (free)
+3. Copy and paste it above
+4. Or add it to your .env file as GEMINI_API_KEY
+"""
 
-# Configure Gemini API
-api_key = os.getenv("GEMINI_API_KEY")
+# Configure Gemini API (.env is read once per server process)
+api_key = load_api_key()
 api_configured = False
+if not api_key:
+    # Don't keep the miss cached, so a fixed .env is picked up on the next run
+    load_api_key.clear()
 
 if not api_key:
     # Show sidebar for API key input if not found in environment
@@ -52,22 +41,17 @@ if not api_key:
         api_key = st.text_input("Enter your Gemini API Key", type="password", key="api_key_input")
         
         if api_key:
-            with st.spinner("Validating API key..."):
-                is_valid, message = validate_api_key(api_key)
-                if is_valid:
-                    st.success(f"✅ {message}")
-                    api_configured = True
-                else:
-                    st.error(f"❌ {message}")
+            is_valid, message = validate_api_key(api_key)
+            if is_valid:
+                st.success(f"✅ {message}")
+                api_configured = True
+            else:
+                st.error(f"❌ {message}")
         else:
             st.info("Please enter your API key to continue")
         
         st.markdown("---")
-        st.markdown("### 🔗 How to get Gemini API Key:")
-        st.markdown("1. Visit [Google AI Studio](https://aistudio.google.com/app/apikey)")
-        st.markdown("2. Create a new API key (free)")
-        st.markdown("3. Copy and paste it above")
-        st.markdown("4. Or add it to your .env file as GEMINI_API_KEY")
+        st.markdown(_API_KEY_HELP)
         
         st.markdown("---")
         st.markdown("### 🔧 Troubleshooting:")
@@ -79,86 +63,165 @@ if not api_key:
         - Verify your API quota hasn't been exceeded
         """)
 else:
-    with st.spinner("Validating API key from .env..."):
-        is_valid, message = validate_api_key(api_key)
-        if is_valid:
-            api_configured = True
-        else:
-            st.error(f"❌ {message}")
-            st.error("Please check your .env file or enter a valid API key in the sidebar")
+    is_valid, message = validate_api_key(api_key)
+    if is_valid:
+        api_configured = True
+    else:
+        st.error(f"❌ {message}")
+        st.error("Please check your .env file or enter a valid API key in the sidebar")
+        
+        # Show sidebar for manual input as fallback
+        with st.sidebar:
+            st.header("🔑 API Configuration")
+            st.error("Invalid API key in .env file")
+            api_key_manual = st.text_input("Enter a valid Gemini API Key", type="password", key="api_key_manual")
             
-            # Show sidebar for manual input as fallback
-            with st.sidebar:
-                st.header("🔑 API Configuration")
-                st.error("Invalid API key in .env file")
-                api_key_manual = st.text_input("Enter a valid Gemini API Key", type="password", key="api_key_manual")
-                
-                if api_key_manual:
-                    with st.spinner("Validating manual API key..."):
-                        is_valid_manual, message_manual = validate_api_key(api_key_manual)
-                        if is_valid_manual:
-                            st.success(f"✅ {message_manual}")
-                            api_configured = True
-                            api_key = api_key_manual  # Use manual key
-                        else:
-                            st.error(f"❌ {message_manual}")
-                
-                st.markdown("---")
-                st.markdown("### 🔗 Get a new API Key:")
-                st.markdown("1. Visit [Google AI Studio](https://aistudio.google.com/app/apikey)")
-                st.markdown("2. Create a new API key")
-                st.markdown("3. Make sure to enable Gemini API access")
+            if api_key_manual:
+                is_valid_manual, message_manual = validate_api_key(api_key_manual)
+                if is_valid_manual:
+                    st.success(f"✅ {message_manual}")
+                    api_configured = True
+                    api_key = api_key_manual  # Use manual key
+                else:
+                    st.error(f"❌ {message_manual}")
+            
+            st.markdown("---")
+            st.markdown(_API_KEY_HELP)
 
 # Title and description
 st.title("📝 Cover Letter Generator")
 st.markdown("Generate professional cover letters using AI powered by **Gemini 2.0 Flash**")
 
-# Function to extract text from PDF
-def extract_text_from_pdf(pdf_file):
-    try:
-        pdf_reader = PdfReader(pdf_file)
-        text = ""
-        for page in pdf_reader.pages:
-            text += page.extract_text()
-        return text
-    except Exception as e:
-        st.error(f"Error reading PDF: {str(e)}")
+# Function to extract text from uploaded file
+def extract_text_from_file(uploaded_file, max_pages=None):
+    if uploaded_file is None:
+        return None
+    if uploaded_file.size > MAX_UPLOAD_BYTES:
+        st.error(f"File exceeds {MAX_UPLOAD_BYTES // (1024 * 1024)} MB. Please upload a smaller CV.")
         return None
-
-# Function to extract text from DOCX
-def extract_text_from_docx(docx_file):
     try:
-        doc = docx.Document(docx_file)
-        text = ""
-        for paragraph in doc.paragraphs:
-            text += paragraph.text + "\n"
-        return text
+        return extract_text(uploaded_file.getvalue(), uploaded_file.type, max_pages)
     except Exception as e:
-        st.error(f"Error reading DOCX: {str(e)}")
+        st.error(f"Error reading file: {str(e)}")
         return None
 
-# Function to extract text from uploaded file
-def extract_text_from_file(uploaded_file):
-    if uploaded_file is not None:
-        file_type = uploaded_file.type
-        
-        if file_type == "application/pdf":
-            return extract_text_from_pdf(uploaded_file)
-        elif file_type == "application/vnd.openxmlformats-officedocument.wordprocessingml.document":
-            return extract_text_from_docx(uploaded_file)
-        elif file_type == "text/plain":
-            return str(uploaded_file.read(), "utf-8")
+# Function to generate (or reuse) a letter, streaming it into a placeholder if given
+def _generate_cached(prompt_hash, model_name, prompt, cached_content=None, placeholder=None, refresh=False):
+    key = prompt_key(model_name, prompt_hash)
+    letter = None if refresh else cached_letter(key)
+    if letter is not None:
+        return letter
+
+    client = get_client(api_key)
+    # A context cache stands in for the prompt prefix it holds
+    config = {"cached_content": cached_content} if cached_content else None
+    finish = []
+
+    if placeholder is None:
+        response = client.models.generate_content(model=model_name, contents=prompt, config=config)
+        finish.append(finish_reason(response))
+        letter = response.text or ""
+    else:
+        try:
+            # Opening the stream already waits for the first chunk, so a
+            # failure here means nothing has been shown yet
+            chunks = open_stream(client, model_name, prompt, config, finish=finish)
+        except Exception:
+            # Fall back to a regular call if streaming fails before any output
+            response = client.models.generate_content(model=model_name, contents=prompt, config=config)
+            finish.append(finish_reason(response))
+            letter = response.text or ""
         else:
-            st.error("Unsupported file type. Please upload PDF, DOCX, or TXT files.")
-            return None
-    return None
+            letter = placeholder.write_stream(chunks)
+
+    # Blocked or empty responses are reported, not cached
+    if not letter.strip():
+        st.error("❌ The model returned no text (the response may have been blocked). Try adjusting the job details.")
+        return ""
+    # Neither is a letter cut off at the token limit
+    if "MAX_TOKENS" in finish:
+        st.warning("⚠️ The letter hit the length limit and may be cut off. Try generating it again.")
+        return letter
+    remember_letter(key, letter)
+    return letter
+
+# Document statistics (words, characters, paragraphs), cached on the letter text
+@st.cache_data(show_spinner=False)
+def _stats(text):
+    return len(text.split()), len(text), text.count('\n\n') + 1
+
+# Function to upload the CV prefix to a Gemini context cache once per CV
+def get_cv_cache(cv_prefix):
+    """Return the name of a cached context holding the CV, or None if it is too small to cache"""
+    cv_hash = hashlib.blake2b(cv_prefix.encode(), digest_size=16).hexdigest()
+    cached = st.session_state.get('cv_cache')
+    if cached and cached[0] == cv_hash:
+        return cached[1]
+
+    name = create_context_cache(get_client(api_key), cv_prefix)
+    st.session_state.cv_cache = (cv_hash, name)
+    return name
+
+# Fixed instructions that open every prompt; kept byte-identical so the CV
+# prefix built on top of it can be reused by the context cache
+_PROMPT_STATIC = """
+You are a professional cover letter writer. Based on the following CV/Resume and job information, create a compelling and personalized cover letter.
+
+Please create a cover letter that:
+1. Uses proper business letter format with appropriate salutation and closing
+2. Has a strong opening paragraph that captures attention
+3. Body paragraphs (2-3) that specifically highlight relevant experience and skills from the CV that match the job requirements
+4. Shows genuine enthusiasm for the role and demonstrates knowledge about the company
+5. Includes specific examples and achievements where possible
+6. Addresses any additional requirements mentioned below
+7. Has a compelling closing paragraph with a call to action
+8. Is professional, engaging, and tailored to the specific role
+9. Is approximately 250-400 words in length
+10. Uses active voice and confident language
+11. Avoids generic statements and clichés
+
+Format the cover letter with:
+- Proper date
+- Recipient address (if HR info provided)
+- Professional salutation
+- Well-structured body paragraphs
+- Professional closing and signature line
+
+Make it sound authentic and compelling while maintaining professionalism.
+
+"""
+
+# Per-request prompt templates, filled with str.format
+_CV_TEMPLATE = "{static}CV/RESUME CONTENT:\n{cv_text}\n"
+
+_JOB_TEMPLATE = """
+JOB INFORMATION:
+- Job Title: {job_title}
+- Company Name: {company_name}
+- Job Description: {job_description}
+
+{requirements_info}
+
+ADDITIONAL INSTRUCTIONS:
+{hr_info}
+"""
+
+_REQUIREMENTS_TEMPLATE = """
+ADDITIONAL REQUIREMENTS TO HIGHLIGHT:
+{requirements}
+
+Please make sure to specifically address these requirements in the cover letter.
+"""
 
 # Function to generate cover letter using Gemini 2.0 Flash
-def generate_cover_letter(cv_text, job_description, job_title, company_name, hr_name=None, hr_role=None, requirements=None):
+def generate_cover_letter(cv_text, job_description, job_title, company_name, hr_name=None, hr_role=None, requirements=None, placeholder=None, focus_cv=False, refresh=False):
     try:
-        # Use Gemini 2.0 Flash model
-        model = genai.GenerativeModel('gemini-2.0-flash-exp')
-        
+        # Optionally trim the CV to the sections that match this job
+        if focus_cv:
+            try:
+                cv_text = select_cv_sections(get_client(api_key), cv_text, f"{job_title}\n{job_description}\n{requirements or ''}")
+            except Exception:
+                st.warning("⚠️ Couldn't rank CV sections, using the full CV instead.")
         # Construct the prompt
         hr_info = ""
         if hr_name and hr_role:
@@ -168,54 +231,44 @@ def generate_cover_letter(cv_text, job_description, job_title, company_name, hr_
         
         requirements_info = ""
         if requirements and requirements.strip():
-            requirements_info = f"""
-        ADDITIONAL REQUIREMENTS TO HIGHLIGHT:
-        {requirements}
-        
-        Please make sure to specifically address these requirements in the cover letter.
-        """
+            requirements_info = _REQUIREMENTS_TEMPLATE.format(requirements=requirements)
         
-        prompt = f"""
-        You are a professional cover letter writer. Based on the following CV/Resume and job information, create a compelling and personalized cover letter:
-
-        CV/RESUME CONTENT:
-        {cv_text}
-
-        JOB INFORMATION:
-        - Job Title: {job_title}
-        - Company Name: {company_name}
-        - Job Description: {job_description}
-
-        {requirements_info}
-
-        ADDITIONAL INSTRUCTIONS:
-        {hr_info}
-
-        Please create a cover letter that:
-        1. Uses proper business letter format with appropriate salutation and closing
-        2. Has a strong opening paragraph that captures attention
-        3. Body paragraphs (2-3) that specifically highlight relevant experience and skills from the CV that match the job requirements
-        4. Shows genuine enthusiasm for the role and demonstrates knowledge about the company
-        5. Includes specific examples and achievements where possible
-        6. Addresses any additional requirements mentioned above
-        7. Has a compelling closing paragraph with a call to action
-        8. Is professional, engaging, and tailored to the specific role
-        9. Is approximately 250-400 words in length
-        10. Uses active voice and confident language
-        11. Avoids generic statements and clichés
-
-        Format the cover letter with:
-        - Proper date
-        - Recipient address (if HR info provided)
-        - Professional salutation
-        - Well-structured body paragraphs
-        - Professional closing and signature line
-
-        Make it sound authentic and compelling while maintaining professionalism.
-        """
+        # Static instructions and the CV come first so the prefix stays
+        # byte-identical across jobs; everything job-specific goes at the tail
+        cv_prefix = _CV_TEMPLATE.format(static=_PROMPT_STATIC, cv_text=cv_text)
+
+        # Long CVs are cut down to the start of each section to bound prompt
+        # size, unless the full CV is big enough for the context cache (which
+        # makes resending it cheap); a focused CV is never cached
+        if focus_cv or not cacheable(cv_prefix):
+            trimmed = trim_cv(cv_text)
+            if len(trimmed) < len(cv_text):
+                st.caption(f"✂️ CV shortened from {len(cv_text):,} to {len(trimmed):,} characters for the prompt")
+                cv_text = trimmed
+                cv_prefix = _CV_TEMPLATE.format(static=_PROMPT_STATIC, cv_text=cv_text)
+
+        job_prompt = _JOB_TEMPLATE.format(
+            job_title=job_title,
+            company_name=company_name,
+            job_description=job_description,
+            requirements_info=requirements_info,
+            hr_info=hr_info
+        )
+        prompt = cv_prefix + job_prompt
         
-        response = model.generate_content(prompt)
-        return response.text
+        # Identical inputs give an identical prompt, so repeats skip the API call
+        prompt_hash = prompt_key(prompt)
+
+        # Large CVs are cached server-side and only the job part is sent; a
+        # focused CV differs per job, so there is nothing stable to cache
+        cv_cache = None if focus_cv else get_cv_cache(cv_prefix)
+        if cv_cache:
+            try:
+                return _generate_cached(prompt_hash, CACHE_MODEL, job_prompt, cv_cache, placeholder, refresh)
+            except Exception:
+                # Cache expired or unavailable, send the full prompt instead
+                st.session_state.pop('cv_cache', None)
+        return _generate_cached(prompt_hash, 'gemini-2.0-flash-exp', prompt, placeholder=placeholder, refresh=refresh)
     
     except Exception as e:
         error_msg = str(e)
@@ -236,10 +289,9 @@ def generate_cover_letter(cv_text, job_description, job_title, company_name, hr_
             st.info("Trying with Gemini Pro instead...")
             try:
                 # Fallback to gemini-pro
-                model_fallback = genai.GenerativeModel('gemini-pro')
-                response = model_fallback.generate_content(prompt)
+                letter = _generate_cached(prompt_hash, 'gemini-pro', prompt, placeholder=placeholder, refresh=refresh)
                 st.success("✅ Generated using Gemini Pro (fallback)")
-                return response.text
+                return letter
             except Exception as fallback_error:
                 st.error(f"❌ Fallback also failed: {str(fallback_error)}")
                 return None
@@ -281,6 +333,11 @@ if api_configured:
         • Review and customize the output
         """)
 
+        st.markdown("---")
+        st.header("⚙️ Advanced")
+        max_pages = st.number_input("Max CV pages", min_value=1, max_value=50, value=6,
+                                    help="Only read this many pages of a PDF CV")
+
 # Main interface - only show if API is configured
 if not api_configured:
     st.warning("👈 Please configure your Gemini API key in the sidebar to continue.")
@@ -288,15 +345,19 @@ if not api_configured:
     st.info("**Option 2:** Enter your API key in the sidebar")
     st.stop()
 
-# Create two columns
-col1, col2 = st.columns([1, 1])
+# Connect to Gemini while the user uploads a CV and fills in the form
+warm_up('gemini-2.0-flash-exp', api_key)
 
-with col1:
+# Function to draw the input column; as a fragment, typing in it reruns only
+# this column instead of the whole page
+@st.fragment
+def input_panel():
     st.header("📋 Input Information")
     
     # File uploader for CV/Resume
     uploaded_file = st.file_uploader(
         "Upload your CV/Resume",
+        key="uploaded_file",
         type=['pdf', 'docx', 'txt'],
         help="Supported formats: PDF, DOCX, TXT"
     )
@@ -304,27 +365,41 @@ with col1:
     # Extract text from uploaded file
     cv_text = ""
     if uploaded_file:
-        with st.spinner("Extracting text from file..."):
-            cv_text = extract_text_from_file(uploaded_file)
+        # Reuse the text from the previous run while the same upload (and page
+        # limit) is kept
+        if st.session_state.get('cv_file_id') == (uploaded_file.file_id, max_pages):
+            cv_text = st.session_state.cv_text
+        else:
+            with st.spinner("Extracting text from file..."):
+                cv_text = extract_text_from_file(uploaded_file, max_pages)
             if cv_text:
-                st.success("✅ CV/Resume uploaded successfully!")
-                with st.expander("Preview extracted text"):
-                    st.text_area("Extracted Content", cv_text[:500] + "..." if len(cv_text) > 500 else cv_text, height=150, disabled=True)
+                st.session_state.cv_file_id = (uploaded_file.file_id, max_pages)
+                st.session_state.cv_text = cv_text
+                # A letter for the previous CV no longer applies; redraw the page
+                if st.session_state.pop("result", None) is not None:
+                    st.rerun()
+        if cv_text:
+            st.success("✅ CV/Resume uploaded successfully!")
+            with st.expander("Preview extracted text"):
+                st.text_area("Extracted Content", cv_text[:500] + "..." if len(cv_text) > 500 else cv_text, height=150, disabled=True)
     
     # Job information inputs
     st.subheader("Job Information")
-    job_title = st.text_input(
-        "Job Title/Role *", 
+    st.text_input(
+        "Job Title/Role *",
+        key="job_title",
         placeholder="e.g., Senior Software Engineer",
         help="Enter the exact job title from the job posting"
     )
-    company_name = st.text_input(
-        "Company Name *", 
+    st.text_input(
+        "Company Name *",
+        key="company_name",
         placeholder="e.g., Google Indonesia",
         help="Enter the full company name"
     )
-    job_description = st.text_area(
-        "Job Description *", 
+    st.text_area(
+        "Job Description *",
+        key="job_description",
         placeholder="Paste the complete job description here including requirements, responsibilities, and qualifications...",
         height=200,
         help="Include the full job posting for best results"
@@ -334,27 +409,54 @@ with col1:
     st.subheader("HR Information (Optional)")
     col_hr1, col_hr2 = st.columns(2)
     with col_hr1:
-        hr_name = st.text_input("HR Name", placeholder="e.g., Sarah Johnson")
+        st.text_input("HR Name", placeholder="e.g., Sarah Johnson", key="hr_name")
     with col_hr2:
-        hr_role = st.text_input("HR Role", placeholder="e.g., HR Manager")
+        st.text_input("HR Role", placeholder="e.g., HR Manager", key="hr_role")
     
     # Additional Requirements
     st.subheader("Additional Requirements (Optional)")
-    requirements = st.text_area(
+    st.text_area(
         "Specific Requirements to Highlight",
+        key="requirements",
         placeholder="Enter any specific requirements, skills, or qualifications you want to emphasize in your cover letter...\n\nExample:\n- 5+ years experience in React\n- Strong leadership skills\n- Experience with Agile methodology",
         height=120,
         help="Add any specific points you want to emphasize that might not be fully covered in the job description"
     )
     
-    # Generate button
-    generate_btn = st.button("🚀 Generate Cover Letter", type="primary", use_container_width=True)
+    st.checkbox(
+        "🎯 Focus CV on this job",
+        key="focus_cv",
+        value=False,
+        help="Send only the CV sections most relevant to the job description (smaller, faster prompt for long CVs)"
+    )
+    st.checkbox(
+        "🔄 Regenerate (bypass cache)",
+        key="regenerate",
+        value=False,
+        help="Ask Gemini for a new letter even if these inputs were answered before"
+    )
 
-with col2:
+    # The text the results panel generates from
+    st.session_state.cv_input = cv_text
+
+    # Generate button: the one input that reruns the whole page
+    if st.button("🚀 Generate Cover Letter", type="primary", use_container_width=True):
+        st.session_state.generate = True
+        st.rerun()
+
+# Function to draw the results column; its own buttons ("Show for Copy")
+# rerun only this column
+@st.fragment
+def results_panel():
     st.header("📄 Generated Cover Letter")
     
+    cv_text = st.session_state.get("cv_input", "")
+    job_title = st.session_state.get("job_title", "")
+    company_name = st.session_state.get("company_name", "")
+    job_description = st.session_state.get("job_description", "")
+
     # Check if all required fields are filled
-    if generate_btn:
+    if st.session_state.pop("generate", False):
         if not cv_text:
             st.error("❌ Please upload your CV/Resume first!")
         elif not job_title:
@@ -365,62 +467,79 @@ with col2:
             st.error("❌ Please enter the job description!")
         else:
             with st.spinner("🤖 AI is crafting your personalized cover letter..."):
+                # Show the letter as it streams in, then hand over to the text area
+                preview = st.empty()
                 cover_letter = generate_cover_letter(
-                    cv_text, job_description, job_title, company_name, hr_name, hr_role, requirements
+                    cv_text, job_description, job_title, company_name,
+                    st.session_state.get("hr_name"), st.session_state.get("hr_role"),
+                    st.session_state.get("requirements"),
+                    placeholder=preview, focus_cv=st.session_state.get("focus_cv", False),
+                    refresh=st.session_state.get("regenerate", False)
                 )
-                
-                if cover_letter:
-                    st.success("✅ Cover letter generated successfully!")
-                    
-                    # Display the cover letter
-                    st.text_area(
-                        "Your Cover Letter:",
-                        cover_letter,
-                        height=600,
-                        key="cover_letter_output"
-                    )
-                    
-                    # Action buttons
-                    col_btn1, col_btn2 = st.columns(2)
-                    with col_btn1:
-                        # Download button
-                        st.download_button(
-                            label="📥 Download as TXT",
-                            data=cover_letter,
-                            file_name=f"cover_letter_{company_name.replace(' ', '_')}_{job_title.replace(' ', '_')}.txt",
-                            mime="text/plain",
-                            use_container_width=True
-                        )
-                    
-                    with col_btn2:
-                        # Copy to clipboard info
-                        if st.button("📋 Show for Copy", use_container_width=True):
-                            st.code(cover_letter, language=None)
-                            st.info("💡 Select the text above and copy it (Ctrl+C / Cmd+C)")
-                    
-                    # Additional options
-                    st.markdown("---")
-                    st.subheader("📊 Document Statistics")
-                    words = len(cover_letter.split())
-                    chars = len(cover_letter)
-                    col_stat1, col_stat2, col_stat3 = st.columns(3)
-                    with col_stat1:
-                        st.metric("Words", words)
-                    with col_stat2:
-                        st.metric("Characters", chars)
-                    with col_stat3:
-                        st.metric("Paragraphs", cover_letter.count('\n\n') + 1)
-
-# Default view when no generation is done
-if not generate_btn and col2:
-    with col2:
-        st.info("👈 Fill in the information on the left and click 'Generate Cover Letter' to create your personalized cover letter.")
+                preview.empty()
+
+            if cover_letter:
+                st.success("✅ Cover letter generated successfully!")
+
+                # Keep the letter and its download name until the next
+                # generation or upload, so other reruns redraw it as is
+                slug = SLUG_RE.sub('_', f"{company_name}_{job_title}")
+                st.session_state.result = {
+                    "letter": cover_letter,
+                    "fname": f"cover_letter_{slug}.txt",
+                    "company": company_name,
+                    "title": job_title,
+                }
+
+    result = st.session_state.get("result")
+    if result:
+        cover_letter = result["letter"]
+
+        # Display the cover letter
+        st.text_area(
+            "Your Cover Letter:",
+            cover_letter,
+            height=600
+        )
+        
+        # Action buttons
+        col_btn1, col_btn2 = st.columns(2)
+        with col_btn1:
+            # Download button
+            st.download_button(
+                label="📥 Download as TXT",
+                data=cover_letter,
+                file_name=result["fname"],
+                mime="text/plain",
+                use_container_width=True
+            )
+        
+        with col_btn2:
+            # Copy to clipboard info
+            if st.button("📋 Show for Copy", use_container_width=True):
+                st.code(cover_letter, language=None)
+                st.info("💡 Select the text above and copy it (Ctrl+C / Cmd+C)")
         
+        # Additional options
+        st.markdown("---")
+        st.subheader("📊 Document Statistics")
+        words, chars, paragraphs = _stats(cover_letter)
+        col_stat1, col_stat2, col_stat3 = st.columns(3)
+        with col_stat1:
+            st.metric("Words", words)
+        with col_stat2:
+            st.metric("Characters", chars)
+        with col_stat3:
+            st.metric("Paragraphs", paragraphs)
+    else:
+        # Default view when no generation is done
+        st.info("👈 Fill in the information on the left and click 'Generate Cover Letter' to create your personalized cover letter.")
+    
         # Show example preview
         st.subheader("📄 Sample Output Preview")
         st.markdown("""
         Your generated cover letter will appear here with:
-        
+    
         ✅ **Professional format** with proper business letter structure  
         ✅ **Personalized content** based on your CV and job requirements  
         ✅ **Compelling opening** that captures attention  
@@ -429,6 +548,15 @@ if not generate_btn and col2:
         ✅ **Strong closing** with clear call to action  
         """)
 
+# Create two columns
+col1, col2 = st.columns([1, 1])
+
+with col1:
+    input_panel()
+
+with col2:
+    results_panel()
+
 # Footer
 st.markdown("---")
 st.markdown("### 🔧 Setup Instructions")
@@ -437,7 +565,7 @@ with st.expander("📦 Installation & Setup Guide"):
     st.markdown("""
     **1. Install Required Dependencies:**
     ```bash
-    pip install streamlit google-generativeai PyPDF2 python-docx python-dotenv
+    pip install streamlit google-genai PyPDF2 pypdfium2 python-dotenv
     ```
     
     **2. Create .env file:**
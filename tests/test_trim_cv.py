@@ -0,0 +1,52 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from core import trim_cv
+
+
+def test_short_cv_is_unchanged():
+    cv = "Jane Doe\njane@x.com\n\nExperience\nAcme\n"
+    assert trim_cv(cv) is cv
+
+
+def test_title_case_headings_keep_every_section():
+    cv = ("Jane Doe\njane@x.com\n\nSummary\n" + "Experienced engineer. " * 60
+          + "\n\nExperience\n" + "Acme Corp 2020-2024\nBuilt things and shipped.\n\n" * 150
+          + "Education\nBSc CS\n\nSkills\nPython, Go\n")
+    trimmed = trim_cv(cv)
+    assert 5000 < len(trimmed) <= 6000
+    for part in ("Jane Doe", "Summary", "Experience", "Education\nBSc CS", "Skills\nPython, Go"):
+        assert part in trimmed
+
+
+def test_no_headings_falls_back_to_head_cut():
+    cv = "This is a plain line of the CV text without headings.\n\n" * 160
+    trimmed = trim_cv(cv)
+    assert 5900 < len(trimmed) <= 6000
+    assert cv.startswith(trimmed)
+
+
+def test_docx_shaped_input_uses_the_budget():
+    # DOCX extraction gives one paragraph per line and no blank lines
+    cv = ("JANE DOE\njane@x.com\nEXPERIENCE\n" + "Did a thing at a company for a while.\n" * 250
+          + "EDUCATION\nBSc\nSKILLS\nPython\n")
+    trimmed = trim_cv(cv)
+    assert 5900 < len(trimmed) <= 6000
+    assert trimmed.startswith("JANE DOE\njane@x.com")
+    assert "EDUCATION\nBSc" in trimmed and "SKILLS" in trimmed
+
+
+def test_long_single_line_section_is_cut_on_words():
+    cv = "Summary\n" + "x " * 2000 + "\nExperience\n" + "y " * 5000 + "\nEducation\nBSc\n"
+    trimmed = trim_cv(cv)
+    assert 5900 < len(trimmed) <= 6000
+    assert "Education\nBSc" in trimmed
+
+
+def test_too_many_headings_stays_within_budget():
+    cv = "\n".join(["Python"] * 3500)
+    trimmed = trim_cv(cv)
+    assert 5900 < len(trimmed) <= 6000
+    assert cv.startswith(trimmed)